@@ -0,0 +1,63 @@
+import diplib as dip
+import numpy as np
+
+from napari_lumen_segmentation.distance.distance_widget import (
+    GEODESIC_WINDOW_MARGIN,
+    _windowed_geodesic_distance,
+)
+
+
+def _full_geodesic_distance(
+    mask: np.ndarray, source: np.ndarray, targets: np.ndarray
+) -> np.ndarray:
+    """The geodesic distance transform on the full volume that the windowed version replaces"""
+
+    marker = mask.copy()
+    marker[tuple(source)] = False
+    dist_map = np.array(dip.GeodesicDistanceTransform(marker, mask), dtype=np.float32)
+    return dist_map[tuple(targets.T)]
+
+
+def test_windowed_geodesic_distance_near():
+    # an open volume, all paths stay well within the window
+    mask = np.ones((40, 80, 80), dtype=bool)
+    mask[20, 30:50, 10:70] = False
+    source = np.array([10, 40, 40])
+    targets = np.array([[12, 41, 38], [30, 40, 40], [10, 45, 52]])
+
+    np.testing.assert_allclose(
+        _windowed_geodesic_distance(mask, source, targets),
+        _full_geodesic_distance(mask, source, targets),
+    )
+
+
+def test_windowed_geodesic_distance_far():
+    # a U-shaped corridor, the target is close to the source but the path around the wall leaves the window
+    mask = np.zeros((5, 200, 60), dtype=bool)
+    mask[1:4, 5:195, 5:55] = True
+    mask[1:4, 5:190, 28:32] = False
+    source = np.array([2, 10, 20])
+    targets = np.array([[2, 10, 40], [2, 12, 22]])
+
+    window_radius = 2 * int(np.abs(targets - source).max()) + GEODESIC_WINDOW_MARGIN
+    full = _full_geodesic_distance(mask, source, targets)
+    assert full[0] > window_radius
+
+    np.testing.assert_allclose(
+        _windowed_geodesic_distance(mask, source, targets), full
+    )
+
+
+def test_windowed_geodesic_distance_window_edge():
+    # source and targets close to the border of the volume, so that the window is clipped
+    rng = np.random.default_rng(0)
+    mask = rng.random((30, 60, 60)) > 0.2
+    source = np.array([1, 2, 58])
+    targets = np.array([[0, 0, 59], [3, 10, 50], [5, 1, 45]])
+    mask[tuple(source)] = True
+    mask[tuple(targets.T)] = True
+
+    np.testing.assert_allclose(
+        _windowed_geodesic_distance(mask, source, targets),
+        _full_geodesic_distance(mask, source, targets),
+    )
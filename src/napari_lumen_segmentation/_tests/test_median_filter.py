@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from napari_lumen_segmentation.segmentation.median_filter import (
+    RANK_MEDIAN_MAX_VALUE,
+    median_filter_labels,
+)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 5])
+@pytest.mark.parametrize("shape", [(40, 50), (12, 20, 24)])
+def test_binary_median_filter(shape, size):
+    rng = np.random.default_rng(0)
+    data = (rng.random(shape) > 0.5).astype(np.uint8)
+
+    np.testing.assert_array_equal(
+        median_filter_labels(data, size), ndimage.median_filter(data, size=size)
+    )
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 5])
+@pytest.mark.parametrize("shape", [(40, 50), (12, 20, 24)])
+@pytest.mark.parametrize("max_label", [5, RANK_MEDIAN_MAX_VALUE - 1, 3000])
+def test_label_median_filter(shape, size, max_label):
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, max_label + 1, shape).astype(np.uint16)
+
+    np.testing.assert_array_equal(
+        median_filter_labels(data, size), ndimage.median_filter(data, size=size)
+    )
@@ -0,0 +1,42 @@
+import diplib as dip
+import numpy as np
+import pytest
+
+from napari_lumen_segmentation.segmentation.morph_reconstruction_widget import (
+    binary_reconstruction,
+)
+
+
+def _dip_reconstruction(seeds: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """The DIPlib reconstruction that binary_reconstruction replaces"""
+
+    return (
+        np.asarray(
+            dip.MorphologicalReconstruction(
+                dip.Image(seeds.view(np.uint8), None),
+                dip.Image(mask.view(np.uint8), None),
+            )
+        )
+        > 0
+    )
+
+
+@pytest.mark.parametrize("shape", [(60, 70), (15, 30, 30), (3, 10, 12, 14)])
+def test_binary_reconstruction(shape):
+    rng = np.random.default_rng(0)
+    mask = rng.random(shape) > 0.6
+    seeds = (rng.random(shape) > 0.99) & mask
+
+    np.testing.assert_array_equal(
+        binary_reconstruction(seeds, mask), _dip_reconstruction(seeds, mask)
+    )
+
+
+def test_binary_reconstruction_edge_cases():
+    mask = np.eye(20, dtype=bool)
+
+    # an empty mask, no seeds, and a mask that consists of seeds only
+    empty = np.zeros_like(mask)
+    np.testing.assert_array_equal(binary_reconstruction(empty, empty), empty)
+    np.testing.assert_array_equal(binary_reconstruction(empty, mask), empty)
+    np.testing.assert_array_equal(binary_reconstruction(mask, mask), mask)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from skimage import measure
+
+from napari_lumen_segmentation.segmentation.size_filter_widget import (
+    _filter_by_size,
+    _label_areas,
+)
+
+
+def _random_labels(shape: tuple[int, ...]) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return measure.label(rng.random(shape) > 0.6).astype(np.uint16)
+
+
+@pytest.mark.parametrize("shape", [(60, 70), (15, 30, 30)])
+def test_label_areas(shape):
+    labels = _random_labels(shape)
+    areas = _label_areas(labels)
+
+    for region in measure.regionprops(labels):
+        assert areas[region.label] == region.area
+
+
+@pytest.mark.parametrize("min_size, max_size", [(0, 1000000), (2, 10), (5, 5), (20, 0)])
+@pytest.mark.parametrize("shape", [(60, 70), (15, 30, 30)])
+def test_filter_by_size(shape, min_size, max_size):
+    labels = _random_labels(shape)
+
+    # the regionprops based filtering that _filter_by_size replaces
+    kept = [
+        region.label
+        for region in measure.regionprops(labels)
+        if min_size <= region.area <= max_size
+    ]
+    expected = np.where(np.isin(labels, kept), labels, 0)
+
+    filtered = _filter_by_size(labels, min_size, max_size)
+    assert filtered.dtype == labels.dtype
+    np.testing.assert_array_equal(filtered, expected)
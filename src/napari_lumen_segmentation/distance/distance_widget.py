@@ -1,9 +1,5 @@
 from itertools import combinations
 
-import dask.array as da
-import diplib as dip
-import localthickness as lt
-import matplotlib.pyplot as plt
 import napari
 import numpy as np
 import pandas as pd
@@ -25,6 +21,48 @@ from ..layer_selection.layer_manager import LayerManager
 from ..tables.custom_table_widget import CustomTableWidget
 from .histogram_widget import HistWidget
 
+# extra voxels added around the geodesic distance window
+GEODESIC_WINDOW_MARGIN = 10
+
+
+def _windowed_geodesic_distance(
+    mask: np.ndarray, source: np.ndarray, targets: np.ndarray
+) -> np.ndarray:
+    """Compute the geodesic distances from source to targets within mask.
+
+    The transform is first run on a subvolume around the source. Every path
+    shorter than the window radius stays inside the window, so distances up to
+    the radius are exact. Only if a target is further away (or unreachable) the
+    transform is repeated on the full volume.
+    """
+
+    import diplib as dip
+
+    radius = 2 * int(np.abs(targets - source).max()) + GEODESIC_WINDOW_MARGIN
+    window = tuple(slice(max(0, s - radius), s + radius + 1) for s in source)
+    offset = np.array([w.start for w in window])
+
+    condition = np.ascontiguousarray(mask[window])
+    marker = condition.copy()
+    marker[tuple(source - offset)] = False
+    dist_map = np.array(
+        dip.GeodesicDistanceTransform(
+            dip.Image(marker, None), dip.Image(condition, None)
+        ),
+        dtype=np.float32,
+    )
+    distances = dist_map[tuple((targets - offset).T)]
+
+    if np.all(distances <= radius) or condition.shape == mask.shape:
+        return distances
+
+    marker = mask.copy()
+    marker[tuple(source)] = False
+    dist_map = np.array(
+        dip.GeodesicDistanceTransform(marker, mask), dtype=np.float32
+    )
+    return dist_map[tuple(targets.T)]
+
 
 class DistanceWidget(QScrollArea):
 
@@ -162,7 +200,7 @@ class DistanceWidget(QScrollArea):
 
         mask_coords = np.array(np.nonzero(self.mask_layer.data)).T
         mask_kdtree = KDTree(mask_coords)
-        _, indices = mask_kdtree.query(self.points_layer.data)
+        _, indices = mask_kdtree.query(self.points_layer.data, workers=-1)
         nearest_points = mask_coords[indices]
         self.viewer.add_points(nearest_points, name="Nearest Points on Mask", face_color='green')
 
@@ -195,6 +233,10 @@ class DistanceWidget(QScrollArea):
     def _calculate_geodesic_distance(self):
         """Run geodesic distance map computation"""
 
+        import dask.array as da
+        import diplib as dip
+        import matplotlib.pyplot as plt
+
         if isinstance(self.geodesic_distmap_mask_layer, da.core.Array):
             msg = QMessageBox()
             msg.setWindowTitle("Please convert to an in memory array")
@@ -219,33 +261,42 @@ class DistanceWidget(QScrollArea):
 
         elif isinstance(self.geodesic_distmap_marker_layer, Points):
 
-            if len(self.geodesic_distmap_marker_layer.data) == 1:
-                mask2 = self.geodesic_distmap_mask_layer.data.copy() > 0
-                mask2[
-                    tuple(
-                        self.geodesic_distmap_marker_layer.data[0].astype(int)
-                    )
-                ] = False
+            # keep the float64 coordinates for the reported measurements, the
+            # int32 voxel coordinates are only used for indexing
+            points = self.geodesic_distmap_marker_layer.data
+            pts_int = points.astype(np.int32)
+            mask = self.geodesic_distmap_mask_layer.data > 0
+
+            if len(points) == 1:
+                mask2 = mask.copy()
+                mask2[tuple(pts_int[0])] = False
                 self.viewer.add_image(
                     np.array(
-                        dip.GeodesicDistanceTransform(
-                            mask2, self.geodesic_distmap_mask_layer.data > 0
-                        ),
+                        dip.GeodesicDistanceTransform(mask2, mask),
                         dtype=np.float32,
                     ),
                     colormap="magma",
                 )
 
-            elif len(self.geodesic_distmap_marker_layer.data) > 1:
+            elif len(points) > 1:
 
                 measurements = pd.DataFrame()
                 point_ids = {}
                 unique_id_counter = -1
                 colormap = plt.get_cmap("tab10")
 
-                for point1, point2 in combinations(
-                    self.geodesic_distmap_marker_layer.data, 2
-                ):
+                # compute the geodesic distances from each point to all points
+                # before it with a single transform
+                geodesic_dists = {}
+                for i2 in range(1, len(points)):
+                    distances = _windowed_geodesic_distance(
+                        mask, pts_int[i2], pts_int[:i2]
+                    )
+                    for i1, distance in enumerate(distances):
+                        geodesic_dists[(i1, i2)] = distance
+
+                for i1, i2 in combinations(range(len(points)), 2):
+                    point1, point2 = points[i1], points[i2]
 
                     # Calculate unique IDs for point1 and point2
                     if tuple(point1) not in point_ids:
@@ -258,20 +309,7 @@ class DistanceWidget(QScrollArea):
                     # calculate euclidean distance between the two points
                     euclidean_dist = np.linalg.norm(point1 - point2)
 
-                    # calculate the geodesic distance
-                    mask2 = self.geodesic_distmap_mask_layer.data.copy() > 0
-                    mask2[tuple(point2.astype(int))] = False
-                    dist_map = np.array(
-                        dip.GeodesicDistanceTransform(
-                            mask2, self.geodesic_distmap_mask_layer.data > 0
-                        ),
-                        dtype=np.float32,
-                    )
-                    geodesic_dist = dist_map[tuple(point1.astype(int))]
-
-                    # Get unique colors for point1 and point2 from tab10 colormap
-                    point1_color = colormap(point_ids[tuple(point1)] % 10)
-                    point2_color = colormap(point_ids[tuple(point2)] % 10)
+                    geodesic_dist = geodesic_dists[(i1, i2)]
 
                     # Create a dictionary to store the measurements for this pair of points
                     measurement_dict = {
@@ -283,12 +321,6 @@ class DistanceWidget(QScrollArea):
                         "point2.x": point2[0],
                         "point2.y": point2[1],
                         "point2.z": point2[2],
-                        "point1.color": point1_color[
-                            :3
-                        ],  # Use only RGB components
-                        "point2.color": point2_color[
-                            :3
-                        ],  # Use only RGB components
                         "euclidean_dist": euclidean_dist,
                         "geodesic_dist": geodesic_dist,
                     }
@@ -301,44 +333,31 @@ class DistanceWidget(QScrollArea):
                     measurements.to_dict(orient="list")
                 )
 
-                # Iterate over all rows in the QTableWidget
-                i = 0
-                for index, row in measurements.iterrows():
-                    point1_color = row["point1.color"]
-                    point2_color = row["point2.color"]
+                # Get unique colors for each point ID from the tab10 colormap, once
+                cmap_rgb = (
+                    np.array(
+                        [colormap(i % 10)[:3] for i in range(len(points))]
+                    )
+                    * 255
+                ).astype(np.uint8)
+                qcolors = [QColor(int(r), int(g), int(b)) for r, g, b in cmap_rgb]
 
-                    point1_cols = [0, 2, 3, 4, 8]
-                    point2_cols = [1, 5, 6, 7, 9]
+                point1_cols = [0, 2, 3, 4]
+                point2_cols = [1, 5, 6, 7]
 
-                    # Set background color for point1 cells (columns 0, 1, and 2)
+                # Color the point1 and point2 cells of all rows at once
+                cell_colors = {}
+                for i, (id1, id2) in enumerate(
+                    zip(measurements["point1.ID"], measurements["point2.ID"])
+                ):
                     for j in point1_cols:
-                        self.table_widget._view.item(i, j).setBackground(
-                            QColor(
-                                int(point1_color[0] * 255),
-                                int(point1_color[1] * 255),
-                                int(point1_color[2] * 255),
-                            )
-                        )
-
-                    # Set background color for point2 cells (columns 3, 4, and 5)
+                        cell_colors[(i, j)] = qcolors[id1]
                     for j in point2_cols:
-                        self.table_widget._view.item(i, j).setBackground(
-                            QColor(
-                                int(point2_color[0] * 255),
-                                int(point2_color[1] * 255),
-                                int(point2_color[2] * 255),
-                            )
-                        )
-
-                    i += 1
+                        cell_colors[(i, j)] = qcolors[id2]
+                self.table_widget.set_cell_colors(cell_colors)
 
                 # also set colormap to the points
-                colors = [
-                    colormap(i)
-                    for i in range(
-                        len(self.geodesic_distmap_marker_layer.data)
-                    )
-                ]
+                colors = [colormap(i) for i in range(len(points))]
 
                 self.geodesic_distmap_marker_layer.edge_color = colors
                 self.geodesic_distmap_marker_layer.face_color = colors
@@ -346,6 +365,8 @@ class DistanceWidget(QScrollArea):
     def _calculate_local_thickness(self) -> None:
         """Calculates local thickness of label image and adds the image to the viewer"""
 
+        import localthickness as lt
+
         self.viewer.add_image(
             lt.local_thickness(self.label_manager.selected_layer.data), colormap="magma"
         )
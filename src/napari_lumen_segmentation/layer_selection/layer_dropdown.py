@@ -43,9 +43,12 @@ class LayerDropdown(QComboBox):
             len(self.viewer.layers.selection) == 1
         ):  # Only consider single layer selection
             selected_layer = self.viewer.layers.selection.active
-            if isinstance(selected_layer, self.layer_type):
+            # setCurrentText already emits through currentIndexChanged, only do so if the layer actually changes
+            if (
+                isinstance(selected_layer, self.layer_type)
+                and selected_layer.name != self.currentText()
+            ):
                 self.setCurrentText(selected_layer.name)
-                self._emit_layer_changed()
 
     def _update_dropdown(self) -> None:
         """Update the list of options in the dropdown menu whenever the list of layers is changed"""
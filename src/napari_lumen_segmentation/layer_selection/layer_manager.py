@@ -1,4 +1,5 @@
-import dask.array as da
+import hashlib
+
 import napari
 import numpy as np
 from qtpy.QtWidgets import QGroupBox, QPushButton, QVBoxLayout, QWidget
@@ -6,6 +7,21 @@ from qtpy.QtWidgets import QGroupBox, QPushButton, QVBoxLayout, QWidget
 from .layer_dropdown import LayerDropdown
 
 
+def data_content_key(data) -> tuple:
+    """Cheap key for the content of layer data, to detect in place modifications. Numpy arrays are identified by their shape, dtype and a hash of every few planes along the first axis. Dask arrays by their graph name instead, so that nothing is read from disk."""
+
+    import dask.array as da
+
+    if isinstance(data, da.core.Array):
+        return (data.shape, data.dtype.str, data.name)
+    sample = np.ascontiguousarray(data[:: max(1, data.shape[0] // 8)])
+    return (
+        data.shape,
+        data.dtype.str,
+        hashlib.blake2b(sample.view(np.uint8), digest_size=8).digest(),
+    )
+
+
 class LayerManager(QWidget):
     """QComboBox widget with functions for updating the selected layer and to update the list of options when the list of layers is modified."""
 
@@ -22,10 +38,7 @@ class LayerManager(QWidget):
 
         ### Add option to convert dask array to in-memory array
         self.convert_to_array_btn = QPushButton("Convert to in-memory array")
-        self.convert_to_array_btn.setEnabled(
-            self.selected_layer is not None
-            and isinstance(self.selected_layer.data, da.core.Array)
-        )
+        self.convert_to_array_btn.setEnabled(False)
         self.convert_to_array_btn.clicked.connect(self._convert_to_array)
 
         box = QGroupBox("Selected Labels Layer")
@@ -51,6 +64,8 @@ class LayerManager(QWidget):
     def _update_labels(self, selected_layer) -> None:
         """Update the layer that is set to be the 'labels' layer that is being edited."""
 
+        import dask.array as da
+
         if selected_layer == "":
             self._selected_layer = None
         else:
@@ -63,6 +78,8 @@ class LayerManager(QWidget):
     def _convert_to_array(self) -> None:
         """Convert from dask array to in-memory array. This is necessary for manual editing using the label tools (brush, eraser, fill bucket)."""
 
+        import dask.array as da
+
         if isinstance(self._selected_layer.data, da.core.Array):
             stack = []
             for i in range(self._selected_layer.data.shape[0]):
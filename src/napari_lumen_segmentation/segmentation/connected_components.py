@@ -1,21 +1,39 @@
 import os
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 
+import cc3d
 import dask.array as da
 import napari
 import numpy as np
-import tifffile
 from qtpy.QtWidgets import (
-    QFileDialog,
     QGroupBox,
     QPushButton,
     QVBoxLayout,
     QWidget,
 )
-from skimage.io import imread
 from skimage.measure import label
 
 from ..layer_selection.layer_manager import LayerManager
+from .gpu import use_gpu
+
+
+def _label(data: np.ndarray) -> np.ndarray:
+    """Connected component labeling with full connectivity. Uses cuCIM if a GPU is available and cc3d for 2D and 3D data otherwise, which are both considerably faster than skimage."""
+
+    if use_gpu(data):
+        import cupy as cp
+        from cucim.skimage.measure import label as cu_label
+
+        return cp.asnumpy(cu_label(cp.asarray(data)))
+    if data.ndim <= 3:
+        return cc3d.connected_components(data)
+    return label(data)
+
+
+def _label_block(block: np.ndarray) -> np.ndarray:
+    """Label a single timepoint block of shape (1, ...) of a dask array"""
+
+    return _label(block[0])[np.newaxis].astype(np.uint16)
 
 
 class ConnectedComponents(QWidget):
@@ -26,7 +44,6 @@ class ConnectedComponents(QWidget):
 
         self.viewer = viewer
         self.label_manager = label_manager
-        self.outputdir = None
 
         ### Connected component buttons
         conn_comp_box = QGroupBox("Connected Components Labeling")
@@ -48,10 +65,16 @@ class ConnectedComponents(QWidget):
     def _conn_comp_2d(self):
         """Run conncomp for a 3D (slice by slice) or 2D image"""
 
-        conncomp = np.zeros_like(self.label_manager.selected_layer.data)
+        data = self.label_manager.selected_layer.data
+        # every element is written below, and int32 holds any number of labels per slice, while the input dtype may be int64
+        conncomp = np.empty(data.shape, dtype=np.int32)
 
-        for i in range(self.label_manager.selected_layer.data.shape[0]):
-            conncomp[i] = label(self.label_manager.selected_layer.data[i])
+        # slices are independent, label them in parallel
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for i, labeled in enumerate(
+                executor.map(_label, (data[i] for i in range(data.shape[0])))
+            ):
+                conncomp[i] = labeled
 
         self.label_manager.selected_layer = self.viewer.add_labels(conncomp,
                 name=self.label_manager.selected_layer.name + "_conn_comp_2d",
@@ -64,44 +87,12 @@ class ConnectedComponents(QWidget):
         """Run connected component analysis to (re)label the labels array"""
 
         if isinstance(self.label_manager.selected_layer.data, da.core.Array):
-            if self.outputdir is None:
-                self.outputdir = QFileDialog.getExistingDirectory(self, "Select Output Folder")
-
-            outputdir = os.path.join(
-                self.outputdir,
-                (self.label_manager.selected_layer.name + "_eroded"),
-            )
-            if os.path.exists(outputdir):
-                shutil.rmtree(outputdir)
-            os.mkdir(outputdir)
-
-            for i in range(
-                self.label_manager.selected_layer.data.shape[0]
-            ):  # Loop over the first dimension
-                current_stack = self.label_manager.selected_layer.data[
-                    i
-                ].compute()  # Compute the current stack
-                relabeled = label(current_stack)
-                tifffile.imwrite(
-                    os.path.join(
-                        outputdir,
-                        (
-                            self.label_manager.selected_layer.name
-                            + "_conn_comp_TP"
-                            + str(i).zfill(4)
-                            + ".tif"
-                        ),
-                    ),
-                    np.array(relabeled, dtype="uint16"),
-                )
-
-            file_list = [
-                os.path.join(outputdir, fname)
-                for fname in os.listdir(outputdir)
-                if fname.endswith(".tif")
-            ]
+            # label each timepoint lazily in its own block, so that nothing has
+            # to be written to and read back from disk
+            data = self.label_manager.selected_layer.data
+            data = data.rechunk((1,) + data.shape[1:])
             self.label_manager.selected_layer = self.viewer.add_labels(
-                da.stack([imread(fname) for fname in sorted(file_list)]),
+                data.map_blocks(_label_block, dtype=np.uint16),
                 name=self.label_manager.selected_layer.name + "_conn_comp",
             )
             self.label_manager._update_labels(
@@ -109,7 +100,7 @@ class ConnectedComponents(QWidget):
             )
             return True
         else:
-            self.label_manager.selected_layer = self.viewer.add_labels(label(self.label_manager.selected_layer.data),
+            self.label_manager.selected_layer = self.viewer.add_labels(_label(self.label_manager.selected_layer.data),
                 name=self.label_manager.selected_layer.name + "_conn_comp",
             )
             self.label_manager._update_labels(
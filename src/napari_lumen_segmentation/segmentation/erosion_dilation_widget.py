@@ -1,12 +1,8 @@
-import os
-import shutil
 
 import dask.array as da
 import napari
 import numpy as np
-import tifffile
 from qtpy.QtWidgets import (
-    QFileDialog,
     QGroupBox,
     QHBoxLayout,
     QLabel,
@@ -17,10 +13,30 @@ from qtpy.QtWidgets import (
 )
 from scipy import ndimage
 from scipy.ndimage import binary_erosion
-from skimage.io import imread
 from skimage.segmentation import expand_labels
 
 from ..layer_selection.layer_manager import LayerManager
+from .tiff_stack import compute_to_tiff_stack
+
+
+def _erode(labels: np.ndarray, structuring_element: np.ndarray, iterations: int) -> np.ndarray:
+    """Erode the labels, after filling the holes in the foreground"""
+
+    filled_mask = ndimage.binary_fill_holes(labels > 0)
+    eroded_mask = binary_erosion(
+        filled_mask,
+        structure=structuring_element,
+        iterations=iterations,
+    )
+    return labels * eroded_mask
+
+
+def _dilate(labels: np.ndarray, distance: int, iterations: int) -> np.ndarray:
+    """Expand the labels by distance, the given number of times"""
+
+    for _ in range(iterations):
+        labels = expand_labels(labels, distance=distance)
+    return labels
 
 
 class ErosionDilationWidget(QWidget):
@@ -88,51 +104,15 @@ class ErosionDilationWidget(QWidget):
         )  # Define a 3x3x3 structuring element for 3D erosion
 
         if isinstance(self.label_manager.selected_layer.data, da.core.Array):
-            if self.outputdir is None:
-                self.outputdir = QFileDialog.getExistingDirectory(self, "Select Output Folder")
-
-            outputdir = os.path.join(
+            eroded_stack = compute_to_tiff_stack(
+                self.label_manager.selected_layer.data,
+                lambda stack: _erode(stack, structuring_element, iterations),
                 self.outputdir,
-                (self.label_manager.selected_layer.name + "_eroded"),
+                self.label_manager.selected_layer.name + "_eroded",
             )
-            if os.path.exists(outputdir):
-                shutil.rmtree(outputdir)
-            os.mkdir(outputdir)
-
-            for i in range(
-                self.label_manager.selected_layer.data.shape[0]
-            ):  # Loop over the first dimension
-                current_stack = self.label_manager.selected_layer.data[
-                    i
-                ].compute()  # Compute the current stack
-                mask = current_stack > 0
-                filled_mask = ndimage.binary_fill_holes(mask)
-                eroded_mask = binary_erosion(
-                    filled_mask,
-                    structure=structuring_element,
-                    iterations=iterations,
-                )
-                eroded = np.where(eroded_mask, current_stack, 0)
-                tifffile.imwrite(
-                    os.path.join(
-                        outputdir,
-                        (
-                            self.label_manager.selected_layer.name
-                            + "_eroded_TP"
-                            + str(i).zfill(4)
-                            + ".tif"
-                        ),
-                    ),
-                    np.array(eroded, dtype="uint16"),
-                )
 
-            file_list = [
-                os.path.join(outputdir, fname)
-                for fname in os.listdir(outputdir)
-                if fname.endswith(".tif")
-            ]
             self.label_manager.selected_layer = self.viewer.add_labels(
-                da.stack([imread(fname) for fname in sorted(file_list)]),
+                eroded_stack,
                 name=self.label_manager.selected_layer.name + "_eroded",
             )
             self.label_manager._update_labels(
@@ -142,26 +122,14 @@ class ErosionDilationWidget(QWidget):
 
         else:
             if len(self.label_manager.selected_layer.data.shape) == 4:
-                stack = []
-                for i in range(
-                    self.label_manager.selected_layer.data.shape[0]
-                ):
-                    mask = self.label_manager.selected_layer.data[i] > 0
-                    filled_mask = ndimage.binary_fill_holes(mask)
-                    eroded_mask = binary_erosion(
-                        filled_mask,
-                        structure=structuring_element,
-                        iterations=iterations,
-                    )
-                    stack.append(
-                        np.where(
-                            eroded_mask,
-                            self.label_manager.selected_layer.data[i],
-                            0,
-                        )
-                    )
+                data = self.label_manager.selected_layer.data
+
+                # write each timepoint into a preallocated output, instead of stacking a list of results
+                eroded = np.empty_like(data)
+                for i in range(data.shape[0]):
+                    eroded[i] = _erode(data[i], structuring_element, iterations)
                 self.label_manager.selected_layer = self.viewer.add_labels(
-                    np.stack(stack, axis=0),
+                    eroded,
                     name=self.label_manager.selected_layer.name + "_eroded",
                 )
                 self.label_manager._update_labels(
@@ -176,9 +144,7 @@ class ErosionDilationWidget(QWidget):
                     iterations=iterations,
                 )
                 self.label_manager.selected_layer = self.viewer.add_labels(
-                    np.where(
-                        eroded_mask, self.label_manager.selected_layer.data, 0
-                    ),
+                    self.label_manager.selected_layer.data * eroded_mask,
                     name=self.label_manager.selected_layer.name + "_eroded",
                 )
                 self.label_manager._update_labels(
@@ -194,47 +160,15 @@ class ErosionDilationWidget(QWidget):
         iterations = self.iterations.value()
 
         if isinstance(self.label_manager.selected_layer.data, da.core.Array):
-            if self.outputdir is None:
-                self.outputdir = QFileDialog.getExistingDirectory(self, "Select Output Folder")
-
-            outputdir = os.path.join(
+            dilated_stack = compute_to_tiff_stack(
+                self.label_manager.selected_layer.data,
+                lambda stack: _dilate(stack, diam, iterations),
                 self.outputdir,
-                (self.label_manager.selected_layer.name + "_dilated"),
+                self.label_manager.selected_layer.name + "_dilated",
             )
-            if os.path.exists(outputdir):
-                shutil.rmtree(outputdir)
-            os.mkdir(outputdir)
-
-            for i in range(
-                self.label_manager.selected_layer.data.shape[0]
-            ):  # Loop over the first dimension
-                expanded_labels = self.label_manager.selected_layer.data[
-                    i
-                ].compute()  # Compute the current stack
-                for _j in range(iterations):
-                    expanded_labels = expand_labels(
-                        expanded_labels, distance=diam
-                    )
-                tifffile.imwrite(
-                    os.path.join(
-                        outputdir,
-                        (
-                            self.label_manager.selected_layer.name
-                            + "_dilated_TP"
-                            + str(i).zfill(4)
-                            + ".tif"
-                        ),
-                    ),
-                    np.array(expanded_labels, dtype="uint16"),
-                )
 
-            file_list = [
-                os.path.join(outputdir, fname)
-                for fname in os.listdir(outputdir)
-                if fname.endswith(".tif")
-            ]
             self.label_manager.selected_layer = self.viewer.add_labels(
-                da.stack([imread(fname) for fname in sorted(file_list)]),
+                dilated_stack,
                 name=self.label_manager.selected_layer.name + "_dilated",
             )
             self.label_manager._update_labels(
@@ -244,18 +178,14 @@ class ErosionDilationWidget(QWidget):
 
         else:
             if len(self.label_manager.selected_layer.data.shape) == 4:
-                stack = []
-                for i in range(
-                    self.label_manager.selected_layer.data.shape[0]
-                ):
-                    expanded_labels = self.label_manager.selected_layer.data[i]
-                    for _j in range(iterations):
-                        expanded_labels = expand_labels(
-                            expanded_labels, distance=diam
-                        )
-                    stack.append(expanded_labels)
+                data = self.label_manager.selected_layer.data
+
+                # write each timepoint into a preallocated output, instead of stacking a list of results
+                dilated = np.empty_like(data)
+                for i in range(data.shape[0]):
+                    dilated[i] = _dilate(data[i], diam, iterations)
                 self.label_manager.selected_layer = self.viewer.add_labels(
-                    np.stack(stack, axis=0),
+                    dilated,
                     name=self.label_manager.selected_layer.name + "_dilated",
                 )
                 self.label_manager._update_labels(
@@ -0,0 +1,29 @@
+"""
+Optional GPU acceleration through CuPy and cuCIM
+"""
+
+import functools
+
+import numpy as np
+
+# arrays smaller than this are processed on the CPU, for those the transfer to the GPU outweighs the gain
+GPU_MIN_SIZE = 1_000_000
+
+
+@functools.lru_cache(maxsize=None)
+def gpu_available() -> bool:
+    """Check whether cupy and cucim are installed and a CUDA device is present"""
+
+    try:
+        import cucim  # noqa: F401
+        import cupy as cp
+
+        return cp.cuda.runtime.getDeviceCount() > 0
+    except (ImportError, RuntimeError):
+        return False
+
+
+def use_gpu(data: np.ndarray) -> bool:
+    """Whether to process this array on the GPU"""
+
+    return data.size >= GPU_MIN_SIZE and gpu_available()
@@ -1,12 +1,10 @@
 import os
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 import dask.array as da
 import napari
 import numpy as np
-import tifffile
 from qtpy.QtWidgets import (
-    QFileDialog,
     QGroupBox,
     QHBoxLayout,
     QLabel,
@@ -16,9 +14,58 @@ from qtpy.QtWidgets import (
     QWidget,
 )
 from scipy import ndimage
-from skimage.io import imread
+from skimage.filters import rank
 
 from ..layer_selection.layer_manager import LayerManager
+from .gpu import use_gpu
+from .tiff_stack import compute_to_tiff_stack
+
+# the histogram based rank filter slows down with the number of bins. From 1024 bins on skimage warns about bad
+# performance and ndimage is faster, so only smaller maximum values use the rank filter
+RANK_MEDIAN_MAX_VALUE = 1024
+
+
+def _binary_median_filter(data: np.ndarray, size: int) -> np.ndarray:
+    """Median filter for data containing only zeros and ones. The median of a binary neighborhood is 1 if the majority of it is 1, so the separable box sum of the ones is enough."""
+
+    counts = data.astype(np.int32)
+    for axis in range(data.ndim):
+        counts = ndimage.correlate1d(
+            counts, np.ones(size, dtype=np.int32), axis=axis, mode="reflect"
+        )
+    n = size**data.ndim
+    return (counts >= n - n // 2).astype(data.dtype)
+
+
+def median_filter_labels(data: np.ndarray, size: int) -> np.ndarray:
+    """Median filter with a cubic footprint of the given size, identical to ndimage.median_filter. Runs on the GPU if available. Otherwise binary masks use a separable box sum, and 2D and 3D integer data with a limited number of distinct values (such as labels) use the much faster histogram based skimage rank filter."""
+
+    if use_gpu(data):
+        import cupy as cp
+        from cupyx.scipy import ndimage as cp_ndimage
+
+        return cp.asnumpy(cp_ndimage.median_filter(cp.asarray(data), size=size))
+    if size > 0 and (
+        np.issubdtype(data.dtype, np.integer) or data.dtype == bool
+    ):
+        min_value, max_value = data.min(), data.max()
+        if min_value >= 0 and max_value <= 1:
+            return _binary_median_filter(data, size)
+        if (
+            data.ndim in (2, 3)
+            and min_value >= 0
+            and max_value < RANK_MEDIAN_MAX_VALUE
+        ):
+            # rank filters ignore out of bounds pixels, pad symmetrically to match the 'reflect' mode of ndimage
+            pad = size // 2
+            filtered = rank.median(
+                np.pad(data.astype(np.uint16, copy=False), pad, mode="symmetric"),
+                footprint=np.ones((size,) * data.ndim, dtype=bool),
+            )
+            return filtered[
+                tuple(slice(pad, pad + s) for s in data.shape)
+            ].astype(data.dtype, copy=False)
+    return ndimage.median_filter(data, size=size)
 
 
 class MedianFilter(QWidget):
@@ -57,56 +104,18 @@ class MedianFilter(QWidget):
     def _smooth_objects(self) -> None:
         """Smooth objects by using a median filter."""
 
-        if isinstance(self.label_manager.selected_layer.data, da.core.Array):
-            if self.outputdir is None:
-                self.outputdir = QFileDialog.getExistingDirectory(self, "Select Output Folder")
-
-                outputdir = os.path.join(
-                    self.outputdir,
-                    (self.label_manager.selected_layer.name + "_median_filter"),
-                )
-                if os.path.exists(outputdir):
-                    shutil.rmtree(outputdir)
-                os.mkdir(outputdir)
+        size = self.median_radius_field.value()
 
-            else:
-                outputdir = os.path.join(
-                    self.outputdir,
-                    (self.label_manager.selected_layer.name + "_median_filter"),
-                )
-                if os.path.exists(outputdir):
-                    shutil.rmtree(outputdir)
-                os.mkdir(outputdir)
-
-            for i in range(
-                self.label_manager.selected_layer.data.shape[0]
-            ):  # Loop over the first dimension
-                current_stack = self.label_manager.selected_layer.data[
-                    i
-                ].compute()  # Compute the current stack
-                smoothed = ndimage.median_filter(
-                    current_stack, size=self.median_radius_field.value()
-                )
-                tifffile.imwrite(
-                    os.path.join(
-                        outputdir,
-                        (
-                            self.label_manager.selected_layer.name
-                            + "_median_filter_TP"
-                            + str(i).zfill(4)
-                            + ".tif"
-                        ),
-                    ),
-                    np.array(smoothed, dtype="uint16"),
-                )
+        if isinstance(self.label_manager.selected_layer.data, da.core.Array):
+            smoothed = compute_to_tiff_stack(
+                self.label_manager.selected_layer.data,
+                lambda stack: median_filter_labels(stack, size),
+                self.outputdir,
+                self.label_manager.selected_layer.name + "_median_filter",
+            )
 
-            file_list = [
-                os.path.join(outputdir, fname)
-                for fname in os.listdir(outputdir)
-                if fname.endswith(".tif")
-            ]
             self.label_manager.selected_layer = self.viewer.add_labels(
-                da.stack([imread(fname) for fname in sorted(file_list)]),
+                smoothed,
                 name=self.label_manager.selected_layer.name + "_median_filter",
             )
             self.label_manager._update_labels(
@@ -115,17 +124,19 @@ class MedianFilter(QWidget):
 
         else:
             if len(self.label_manager.selected_layer.data.shape) == 4:
-                stack = []
-                for i in range(
-                    self.label_manager.selected_layer.data.shape[0]
-                ):
-                    smoothed = ndimage.median_filter(
-                        self.label_manager.selected_layer.data[i],
-                        size=self.median_radius_field.value(),
-                    )
-                    stack.append(smoothed)
+                data = self.label_manager.selected_layer.data
+                smoothed = np.empty_like(data)
+
+                # timepoints are independent, filter them in parallel
+                with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                    for i, filtered in enumerate(
+                        executor.map(
+                            lambda stack: median_filter_labels(stack, size), data
+                        )
+                    ):
+                        smoothed[i] = filtered
                 self.label_manager.selected_layer = self.viewer.add_labels(
-                    np.stack(stack, axis=0),
+                    smoothed,
                     name=self.label_manager.selected_layer.name + "_median_filter",
                 )
                 self.label_manager._update_labels(
@@ -134,9 +145,9 @@ class MedianFilter(QWidget):
 
             elif len(self.label_manager.selected_layer.data.shape) == 3:
                 self.label_manager.selected_layer = self.viewer.add_labels(
-                    ndimage.median_filter(
+                    median_filter_labels(
                         self.label_manager.selected_layer.data,
-                        size=self.median_radius_field.value(),
+                        size=size,
                     ),
                     name=self.label_manager.selected_layer.name + "_median_filter",
                 )
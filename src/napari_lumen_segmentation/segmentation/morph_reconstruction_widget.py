@@ -1,3 +1,4 @@
+import cc3d
 import napari
 import numpy as np
 from napari.layers import Image, Labels
@@ -10,9 +11,54 @@ from qtpy.QtWidgets import (
     QVBoxLayout,
     QWidget,
 )
-from skimage.morphology import reconstruction
+from scipy import ndimage
 
 from ..layer_selection.layer_dropdown import LayerDropdown
+from .gpu import use_gpu
+
+
+def binary_reconstruction(seeds: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Binary morphological reconstruction by dilation of the seeds within the mask, with full connectivity (like skimage). The seeds must lie within the mask."""
+
+    # nothing can be reconstructed outside the bounding box of the mask, restrict the computation to it
+    reconst = np.zeros_like(mask)
+    bbox = ndimage.find_objects(mask.view(np.uint8))
+    if bbox:
+        bbox = bbox[0]
+        if np.array_equal(seeds[bbox], mask[bbox]):
+            # every voxel of the mask is a seed already, there is nothing to grow into
+            reconst[bbox] = mask[bbox]
+        elif use_gpu(mask[bbox]):
+            import cupy as cp
+            from cucim.skimage.morphology import reconstruction
+
+            reconst[bbox] = cp.asnumpy(
+                reconstruction(
+                    cp.asarray(seeds[bbox].view(np.uint8)),
+                    cp.asarray(mask[bbox].view(np.uint8)),
+                )
+            )
+        elif mask.ndim <= 3:
+            # for binary images, the reconstruction consists of the connected components of the mask that contain a seed
+            # (full connectivity, like skimage)
+            components, n = cc3d.connected_components(
+                mask[bbox], return_N=True
+            )
+            seeded = np.zeros(n + 1, dtype=bool)
+            seeded[components[seeds[bbox]]] = True
+            seeded[0] = False
+            reconst[bbox] = seeded[components]
+        else:
+            import diplib as dip
+
+            # DIPlib's queue-based reconstruction (full connectivity, like skimage)
+            reconst[bbox] = np.asarray(
+                dip.MorphologicalReconstruction(
+                    dip.Image(seeds[bbox].view(np.uint8), None),
+                    dip.Image(mask[bbox].view(np.uint8), None),
+                )
+            )
+    return reconst
 
 
 class MorphReconstructionWidget(QWidget):
@@ -105,11 +151,19 @@ class MorphReconstructionWidget(QWidget):
         """Run custom region growing algorithm"""
 
         # define a mask of pixels that fulfill both the threshold criteria and are in the 'mask' layer
-        mask = (self.region_growing_int_layer.data >= self.min_threshold.value()) & (self.region_growing_int_layer.data <= self.max_threshold.value()) & (self.mask.data > 0)
-        seeds = (self.seeds_layer.data > 0) & (mask > 0)
-
-        reconst = reconstruction(seeds * 1, mask * 2)
-        result = np.logical_or(self.seeds_layer.data > 0, reconst > 0).astype(int)
+        # (combined in place, to avoid allocating a temporary array per condition)
+        int_data = self.region_growing_int_layer.data
+        mask = int_data >= self.min_threshold.value()
+        mask &= int_data <= self.max_threshold.value()
+        mask &= self.mask.data > 0
+        seeds_in = self.seeds_layer.data > 0
+        seeds = seeds_in & mask
+
+        reconst = binary_reconstruction(seeds, mask)
+
+        # add the seeds in place, and hand the binary result to napari as uint8 rather than int64
+        np.logical_or(reconst, seeds_in, out=reconst)
+        result = reconst.view(np.uint8)
 
         self.seeds_layer = self.viewer.add_labels(result, name = "morphological reconstruction")
         self.seeds_dropdown.setCurrentText("morphological reconstruction")
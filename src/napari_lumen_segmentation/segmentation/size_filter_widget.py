@@ -1,14 +1,11 @@
-import functools
 import os
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 import dask.array as da
 import napari
 import numpy as np
-import tifffile
 from qtpy.QtCore import Qt
 from qtpy.QtWidgets import (
-    QFileDialog,
     QGroupBox,
     QHBoxLayout,
     QLabel,
@@ -17,10 +14,26 @@ from qtpy.QtWidgets import (
     QVBoxLayout,
     QWidget,
 )
-from skimage import measure
-from skimage.io import imread
 
 from ..layer_selection.layer_manager import LayerManager
+from .tiff_stack import compute_to_tiff_stack
+
+
+def _label_areas(labels: np.ndarray) -> np.ndarray:
+    """Count the pixels of each label in a single pass, indexed by label value (index 0 is the background)"""
+
+    return np.bincount(labels.ravel().astype(np.intp, copy=False))
+
+
+def _filter_by_size(labels: np.ndarray, min_size: int, max_size: int) -> np.ndarray:
+    """Remove the labels with a size in pixels outside of [min_size, max_size]"""
+
+    # filter through a lookup table on the label areas, instead of measuring each region
+    counts = _label_areas(labels)
+    keep = (counts >= min_size) & (counts <= max_size)
+    keep[0] = False
+    # multiplying by the boolean mask keeps the dtype and avoids the extra pass of np.where
+    return labels * keep[labels]
 
 
 class SizeFilterWidget(QWidget):
@@ -68,59 +81,21 @@ class SizeFilterWidget(QWidget):
     def _delete_objects(self) -> None:
         """Delete objects in the selected layer that are too small or too big"""
 
-        if isinstance(self.label_manager.selected_layer.data, da.core.Array):
-            if self.outputdir is None:
-                self.outputdir = QFileDialog.getExistingDirectory(self, "Select Output Folder")
+        min_size = self.min_size_field.value()
+        max_size = self.max_size_field.value()
+        layer = self.label_manager.selected_layer
 
-            outputdir = os.path.join(
+        if isinstance(layer.data, da.core.Array):
+            filtered_stack = compute_to_tiff_stack(
+                layer.data,
+                lambda stack: _filter_by_size(stack, min_size, max_size),
                 self.outputdir,
-                (self.label_manager.selected_layer.name + "_sizefiltered"),
+                layer.name + "_sizefiltered",
             )
-            if os.path.exists(outputdir):
-                shutil.rmtree(outputdir)
-            os.mkdir(outputdir)
-
-            for i in range(
-                self.label_manager.selected_layer.data.shape[0]
-            ):  # Loop over the first dimension
-                current_stack = self.label_manager.selected_layer.data[
-                    i
-                ].compute()  # Compute the current stack
-
-                # measure the sizes in pixels of the labels in slice using skimage.regionprops
-                props = measure.regionprops(current_stack)
-                filtered_labels = [
-                    p.label
-                    for p in props
-                    if (p.area >= self.min_size_field.value() and p.area <= self.max_size_field.value())
-                ]
-                mask = functools.reduce(
-                    np.logical_or,
-                    (current_stack == val for val in filtered_labels),
-                )
-                filtered = np.where(mask, current_stack, 0)
-                tifffile.imwrite(
-                    os.path.join(
-                        outputdir,
-                        (
-                            self.label_manager.selected_layer.name
-                            + "_sizefiltered_TP"
-                            + str(i).zfill(4)
-                            + ".tif"
-                        ),
-                    ),
-                    np.array(filtered, dtype="uint16"),
-                )
 
-            file_list = [
-                os.path.join(outputdir, fname)
-                for fname in os.listdir(outputdir)
-                if fname.endswith(".tif")
-            ]
             self.label_manager.selected_layer = self.viewer.add_labels(
-                da.stack([imread(fname) for fname in sorted(file_list)]),
-                name=self.label_manager.selected_layer.name
-                + "_sizefiltered",
+                filtered_stack,
+                name=layer.name + "_sizefiltered",
             )
             self.label_manager._update_labels(
                 self.label_manager.selected_layer.name
@@ -128,59 +103,31 @@ class SizeFilterWidget(QWidget):
 
         else:
             # Image data is a normal array and can be directly edited.
-            if len(self.label_manager.selected_layer.data.shape) == 4:
-                stack = []
-                for i in range(
-                    self.label_manager.selected_layer.data.shape[0]
-                ):
-                    props = measure.regionprops(
-                        self.label_manager.selected_layer.data[i]
-                    )
-                    filtered_labels = [
-                        p.label
-                        for p in props
-                        if (p.area >= self.min_size_field.value() and p.area <= self.max_size_field.value())
-                    ]
-                    mask = functools.reduce(
-                        np.logical_or,
-                        (
-                            self.label_manager.selected_layer.data[i] == val
-                            for val in filtered_labels
-                        ),
-                    )
-                    filtered = np.where(
-                        mask, self.label_manager.selected_layer.data[i], 0
-                    )
-                    stack.append(filtered)
+            if len(layer.data.shape) == 4:
+                data = layer.data
+                filtered = np.empty_like(data)
+
+                # timepoints are independent, filter them in parallel
+                with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                    for i, filtered_stack in enumerate(
+                        executor.map(
+                            lambda stack: _filter_by_size(stack, min_size, max_size),
+                            data,
+                        )
+                    ):
+                        filtered[i] = filtered_stack
                 self.label_manager.selected_layer = self.viewer.add_labels(
-                    np.stack(stack, axis=0),
-                    name=self.label_manager.selected_layer.name
-                    + "_sizefiltered",
+                    filtered,
+                    name=layer.name + "_sizefiltered",
                 )
                 self.label_manager._update_labels(
                     self.label_manager.selected_layer.name
                 )
 
-            elif len(self.label_manager.selected_layer.data.shape) == 3:
-                props = measure.regionprops(
-                    self.label_manager.selected_layer.data
-                )
-                filtered_labels = [
-                    p.label
-                    for p in props
-                    if (p.area >= self.min_size_field.value() and p.area <= self.max_size_field.value())
-                ]
-                mask = functools.reduce(
-                    np.logical_or,
-                    (
-                        self.label_manager.selected_layer.data == val
-                        for val in filtered_labels
-                    ),
-                )
+            elif len(layer.data.shape) == 3:
                 self.label_manager.selected_layer = self.viewer.add_labels(
-                    np.where(mask, self.label_manager.selected_layer.data, 0),
-                    name=self.label_manager.selected_layer.name
-                    + "_sizefiltered",
+                    _filter_by_size(layer.data, min_size, max_size),
+                    name=layer.name + "_sizefiltered",
                 )
                 self.label_manager._update_labels(
                     self.label_manager.selected_layer.name
@@ -1,14 +1,10 @@
 import copy
-import os
-import shutil
 
 import dask.array as da
 import napari
 import numpy as np
-import tifffile
 from qtpy.QtCore import Qt
 from qtpy.QtWidgets import (
-    QFileDialog,
     QGroupBox,
     QHBoxLayout,
     QLabel,
@@ -17,10 +13,19 @@ from qtpy.QtWidgets import (
     QVBoxLayout,
     QWidget,
 )
-from scipy import ndimage
-from skimage.io import imread
 
 from ..layer_selection.layer_manager import LayerManager
+from .median_filter import median_filter_labels
+from .tiff_stack import compute_to_tiff_stack
+
+
+def _smooth(stack: np.ndarray, size: int) -> np.ndarray:
+    """Smooth a single timepoint by combining it with its median filtered version"""
+
+    smoothed = median_filter_labels(stack, size=size)
+
+    # combine smoothed result with original result to selectively grow the mask
+    return np.logical_or(smoothed != 0, stack != 0).astype(np.uint16)
 
 
 class SmoothingWidget(QWidget):
@@ -68,62 +73,20 @@ class SmoothingWidget(QWidget):
     def _smooth_objects(self) -> None:
         """Smooth objects by using a median filter."""
 
-        if isinstance(self.label_manager.selected_layer.data, da.core.Array):
-            if self.outputdir is None:
-                self.outputdir = QFileDialog.getExistingDirectory(self, "Select Output Folder")
-
-                outputdir = os.path.join(
-                    self.outputdir,
-                    (self.label_manager.selected_layer.name + "_smoothed"),
-                )
-                if os.path.exists(outputdir):
-                    shutil.rmtree(outputdir)
-                os.mkdir(outputdir)
+        size = self.median_radius_field.value()
+        n_iterations = self.n_iterations.value()
 
-            else:
-                outputdir = os.path.join(
-                    self.outputdir,
-                    (self.label_manager.selected_layer.name + "_smoothed"),
-                )
-                if os.path.exists(outputdir):
-                    shutil.rmtree(outputdir)
-                os.mkdir(outputdir)
-
-            for i in range(
-                self.label_manager.selected_layer.data.shape[0]
-            ):  # Loop over the first dimension
-                current_stack = self.label_manager.selected_layer.data[
-                    i
-                ].compute()  # Compute the current stack
-                # Apply smoothing using median filter
-                smoothed = ndimage.median_filter(
-                        current_stack,
-                        size=self.median_radius_field.value(),
-                    )
-
-                # combine smoothed result with original result to selectively grow the mask
-                input_data = np.logical_or(smoothed != 0, current_stack != 0).astype(int)
-
-                tifffile.imwrite(
-                    os.path.join(
-                        outputdir,
-                        (
-                            self.label_manager.selected_layer.name
-                            + "_smoothed_TP"
-                            + str(i).zfill(4)
-                            + ".tif"
-                        ),
-                    ),
-                    np.array(input_data, dtype="uint16"),
-                )
+        if isinstance(self.label_manager.selected_layer.data, da.core.Array):
+            smoothed_stack = compute_to_tiff_stack(
+                self.label_manager.selected_layer.data,
+                lambda stack: _smooth(stack, size),
+                self.outputdir,
+                self.label_manager.selected_layer.name + "_smoothed",
+                dtype=np.uint16,
+            )
 
-            file_list = [
-                os.path.join(outputdir, fname)
-                for fname in os.listdir(outputdir)
-                if fname.endswith(".tif")
-            ]
             self.label_manager.selected_layer = self.viewer.add_labels(
-                da.stack([imread(fname) for fname in sorted(file_list)]),
+                smoothed_stack,
                 name=self.label_manager.selected_layer.name + "_smoothed",
             )
             self.label_manager._update_labels(
@@ -132,21 +95,21 @@ class SmoothingWidget(QWidget):
 
         else:
             if len(self.label_manager.selected_layer.data.shape) == 4:
-                stack = []
+                result = np.empty(self.label_manager.selected_layer.data.shape, dtype=np.uint8)
                 for i in range(
                     self.label_manager.selected_layer.data.shape[0]
                 ):
                     # Apply smoothing using median filter
-                    smoothed = ndimage.median_filter(
+                    smoothed = median_filter_labels(
                             self.label_manager.selected_layer.data[i],
-                            size=self.median_radius_field.value(),
+                            size=size,
                         )
 
                     # combine smoothed result with original result to selectively grow the mask
-                    input_data = np.logical_or(smoothed != 0, self.label_manager.selected_layer.data[i] != 0).astype(int)
-                    stack.append(input_data)
+                    # (nonzero counts as True, written directly into the output)
+                    np.logical_or(smoothed, self.label_manager.selected_layer.data[i], out=result[i].view(bool))
                 self.label_manager.selected_layer = self.viewer.add_labels(
-                    np.stack(stack, axis=0),
+                    result,
                     name=self.label_manager.selected_layer.name + "_smoothed",
                 )
                 self.label_manager._update_labels(
@@ -156,16 +119,16 @@ class SmoothingWidget(QWidget):
             elif len(self.label_manager.selected_layer.data.shape) == 3:
 
                 input_data = copy.deepcopy(self.label_manager.selected_layer.data)
-                for _ in range(self.n_iterations.value()):
+                for _ in range(n_iterations):
 
                     # Apply smoothing using median filter
-                    smoothed = ndimage.median_filter(
+                    smoothed = median_filter_labels(
                             input_data,
-                            size=self.median_radius_field.value(),
+                            size=size,
                         )
 
                     # combine smoothed result with original result to selectively grow the mask
-                    input_data = np.logical_or(smoothed != 0, input_data != 0).astype(int)
+                    input_data = np.logical_or(smoothed, input_data).view(np.uint8)
 
                 self.label_manager.selected_layer = self.viewer.add_labels(
                     input_data,
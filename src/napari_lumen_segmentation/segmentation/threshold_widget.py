@@ -1,13 +1,8 @@
-import os
-import shutil
-
 import dask.array as da
 import napari
 import numpy as np
-import tifffile
 from napari.layers import Image, Labels
 from qtpy.QtWidgets import (
-    QFileDialog,
     QGroupBox,
     QHBoxLayout,
     QLabel,
@@ -16,9 +11,9 @@ from qtpy.QtWidgets import (
     QVBoxLayout,
     QWidget,
 )
-from skimage.io import imread
 
 from ..layer_selection.layer_dropdown import LayerDropdown
+from .tiff_stack import compute_to_tiff_stack
 
 
 class ThresholdWidget(QWidget):
@@ -79,56 +74,28 @@ class ThresholdWidget(QWidget):
     def _threshold(self):
         """Threshold the selected label or intensity image"""
 
-        if isinstance(self.threshold_layer.data, da.core.Array):
-            if self.outputdir is None:
-                self.outputdir = QFileDialog.getExistingDirectory(self, "Select Output Folder")
+        min_threshold = int(self.min_threshold.value())
+        max_threshold = int(self.max_threshold.value())
 
-            outputdir = os.path.join(
+        if isinstance(self.threshold_layer.data, da.core.Array):
+            thresholded = compute_to_tiff_stack(
+                self.threshold_layer.data,
+                lambda stack: (stack >= min_threshold) & (stack <= max_threshold),
                 self.outputdir,
-                (self.threshold_layer.name + "_threshold"),
+                self.threshold_layer.name + "_thresholded",
+                dtype=bool,
+                tiff_dtype=np.uint8,
             )
-            if os.path.exists(outputdir):
-                shutil.rmtree(outputdir)
-            os.mkdir(outputdir)
-
-            for i in range(
-                self.threshold_layer.data.shape[0]
-            ):  # Loop over the first dimension
-                data = self.threshold_layer.data[
-                    i
-                ].compute()  # Compute the current stack
-
-                thresholded = (
-                    data >= int(self.min_threshold.value())
-                ) & (data <= int(self.max_threshold.value()))
-
-                tifffile.imwrite(
-                    os.path.join(
-                        outputdir,
-                        (
-                            self.threshold_layer.name
-                            + "_thresholded_TP"
-                            + str(i).zfill(4)
-                            + ".tif"
-                        ),
-                    ),
-                    np.array(thresholded, dtype="uint8"),
-                )
-
-            file_list = [
-                os.path.join(outputdir, fname)
-                for fname in os.listdir(outputdir)
-                if fname.endswith(".tif")
-            ]
+
             self.viewer.add_labels(
-                da.stack([imread(fname) for fname in sorted(file_list)]),
+                thresholded,
                 name=self.threshold_layer.name + "_thresholded",
             )
 
         else:
             thresholded = (
-                self.threshold_layer.data >= int(self.min_threshold.value())
-            ) & (self.threshold_layer.data <= int(self.max_threshold.value()))
+                self.threshold_layer.data >= min_threshold
+            ) & (self.threshold_layer.data <= max_threshold)
             self.viewer.add_labels(
                 thresholded, name=self.threshold_layer.name + "_thresholded"
             )
@@ -0,0 +1,148 @@
+"""
+Writing and lazy reading of the per-timepoint tiff files of the dask branches of the segmentation widgets
+"""
+
+import os
+from collections.abc import Callable
+
+import dask
+import dask.array as da
+import numpy as np
+import tifffile
+
+# number of timepoints that are computed and written at the same time. Each of them is held in memory as a whole,
+# together with the temporaries of the function applied to it, so this stays small instead of scaling with the cores
+MAX_WORKERS = 4
+
+
+def narrowest_dtype(max_label: int) -> np.dtype:
+    """Smallest unsigned integer dtype that holds all labels up to max_label"""
+
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_label <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def write_tiff(
+    data: np.ndarray, path: str, dtype: np.dtype = np.uint16, compress: bool = True
+) -> None:
+    """Write labels as tiff (uint16 by default), with fast zlib compression or, if compress is False, uncompressed and contiguous so that the file can be memory mapped"""
+
+    data = np.asarray(data, dtype=dtype)
+    if compress:
+        compression_kwargs = {"compression": "zlib", "compressionargs": {"level": 1}}
+    else:
+        compression_kwargs = {"compression": None, "contiguous": True}
+    tifffile.imwrite(
+        path,
+        data,
+        **compression_kwargs,
+        # the compressed size is not known in advance, fall back to BigTIFF if the uncompressed data would not fit in a classic tiff
+        bigtiff=data.nbytes > 2**32 - 2**25,
+    )
+
+
+def _read_tiff(path: str) -> np.ndarray:
+    """Memory map a tiff file written without compression, decode it otherwise"""
+
+    try:
+        return tifffile.memmap(path, mode="r")
+    except ValueError:
+        # compressed or non-contiguous image data cannot be memory mapped
+        return tifffile.imread(path)
+
+
+def read_tiff_stack(file_list: list[str]) -> da.core.Array:
+    """Stack the tiff files in file_list along a new first axis, without loading them. Each file is only read (or memory mapped, if it is uncompressed) when its timepoint is accessed."""
+
+    # all timepoints share the shape and dtype of the first one
+    with tifffile.TiffFile(file_list[0]) as tif:
+        shape = tif.series[0].shape
+        dtype = tif.series[0].dtype
+
+    return da.stack(
+        [
+            da.from_delayed(
+                dask.delayed(_read_tiff)(fname), shape=shape, dtype=dtype
+            )
+            for fname in file_list
+        ]
+    )
+
+
+def write_tiff_stack(
+    stack: da.core.Array,
+    outputdir: str,
+    name: str,
+    dtype: np.dtype = np.uint16,
+    compress: bool = True,
+) -> list[str]:
+    """Compute all timepoints of stack in parallel and write each of them to its own tiff file name_TP<i>.tif in outputdir, which must not exist yet. Returns the paths of the files in the order of the timepoints."""
+
+    os.mkdir(outputdir)
+
+    paths = [
+        os.path.join(outputdir, name + "_TP" + str(i).zfill(4) + ".tif")
+        for i in range(stack.shape[0])
+    ]
+    tasks = [
+        dask.delayed(write_tiff)(stack[i], path, dtype, compress)
+        for i, path in enumerate(paths)
+    ]
+    dask.compute(
+        *tasks,
+        scheduler="threads",
+        num_workers=min(MAX_WORKERS, os.cpu_count() or 1),
+    )
+    return paths
+
+
+def _new_directory_path(parent: str, name: str) -> str:
+    """Path of a directory parent/name that does not exist yet, parent/name_<n> with the first free n if it does"""
+
+    path = os.path.join(parent, name)
+    n = 1
+    while os.path.exists(path):
+        path = os.path.join(parent, name + "_" + str(n))
+        n += 1
+    return path
+
+
+def _apply_to_timepoint(block: np.ndarray, func: Callable) -> np.ndarray:
+    """Apply func to the single timepoint of a dask block of shape (1, ...)"""
+
+    return np.asarray(func(block[0]))[np.newaxis]
+
+
+def compute_to_tiff_stack(
+    data: da.core.Array,
+    func: Callable,
+    outputdir: str | None,
+    name: str,
+    dtype: np.dtype | None = None,
+    tiff_dtype: np.dtype = np.uint16,
+) -> da.core.Array:
+    """Apply func to each timepoint of data. Without an outputdir the result stays lazy, so that nothing has to be written to and read back from disk. Otherwise all timepoints are computed in parallel, written to uncompressed tiff files (as tiff_dtype) in a new directory outputdir/name and memory mapped."""
+
+    # rechunk once to a single chunk per timepoint, so that each timepoint is read from disk only once
+    data = data.rechunk((1,) + data.shape[1:])
+    result = data.map_blocks(
+        _apply_to_timepoint,
+        func,
+        dtype=data.dtype if dtype is None else dtype,
+    )
+    if outputdir is None:
+        return result
+
+    # the returned layer keeps reading from the files, never overwrite the directory of an earlier run.
+    # Skip compression, it costs most of the write time and viewing a memory mapped timepoint needs no decoding
+    return read_tiff_stack(
+        write_tiff_stack(
+            result,
+            _new_directory_path(outputdir, name),
+            name,
+            tiff_dtype,
+            compress=False,
+        )
+    )
@@ -4,12 +4,12 @@ Collection of segmentation related widgets
 
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 import dask.array as da
 import napari
 import numpy as np
 import pandas as pd
-import tifffile
 from matplotlib.colors import ListedColormap, to_rgb
 from qtpy.QtWidgets import (
     QFileDialog,
@@ -24,7 +24,7 @@ from qtpy.QtWidgets import (
 )
 from skimage import measure
 
-from ..layer_selection.layer_manager import LayerManager
+from ..layer_selection.layer_manager import LayerManager, data_content_key
 from ..plots.plot_widget import PlotWidget
 from ..tables.custom_table_widget import ColoredTableWidget
 from .connected_components import ConnectedComponents
@@ -35,6 +35,7 @@ from .morph_reconstruction_widget import MorphReconstructionWidget
 from .size_filter_widget import SizeFilterWidget
 from .smoothing_widget import SmoothingWidget
 from .threshold_widget import ThresholdWidget
+from .tiff_stack import narrowest_dtype, write_tiff, write_tiff_stack
 
 
 class SegmentationWidgets(QWidget):
@@ -45,6 +46,7 @@ class SegmentationWidgets(QWidget):
         self.viewer = viewer
         self.layer_manager = layer_manager
         self.tab_widget = QTabWidget(self)
+        self._label_table_cache = {}
 
         ## Define segmentation widgets
         segmentation_layout = QVBoxLayout()
@@ -109,6 +111,15 @@ class SegmentationWidgets(QWidget):
         smooth_close_widget = SmoothingWidget(self.viewer, self.layer_manager)
         segmentation_layout.addWidget(smooth_close_widget)
 
+        # widgets that write their results for dask arrays to the selected output directory
+        self._output_widgets = [
+            size_filter_widget,
+            erode_dilate_widget,
+            threshold_widget,
+            median_widget,
+            smooth_close_widget,
+        ]
+
         ### Widget for custom region growing
         segmentation_layout.addWidget(MorphReconstructionWidget(self.viewer))
 
@@ -120,16 +131,11 @@ class SegmentationWidgets(QWidget):
         scroll_area.setWidgetResizable(True)
 
         ## Define label plot widgets
-        self.label_table_widget = ColoredTableWidget(
-            napari.layers.Labels(np.zeros((10, 10), dtype=np.uint8)),
-            self.viewer,
-        )
-
-        self.label_plot_widget = PlotWidget(props=pd.DataFrame())
+        # the table and plot widgets are created when the first table is requested
+        self.label_table_widget = None
+        self.label_plot_widget = None
         self.label_plotting_widgets = QWidget()
         self.label_plotting_widgets_layout = QVBoxLayout()
-        self.label_plotting_widgets_layout.addWidget(self.label_table_widget)
-        self.label_plotting_widgets_layout.addWidget(self.label_plot_widget)
         self.label_plotting_widgets.setLayout(
             self.label_plotting_widgets_layout
         )
@@ -150,51 +156,75 @@ class SegmentationWidgets(QWidget):
         if path:
             self.output_path.setText(path)
             self.outputdir = str(self.output_path.text())
+            for widget in self._output_widgets:
+                widget.outputdir = self.outputdir
+
+    def _measure_labels(self, tp: int | None) -> dict:
+        """Measure the labels of the selected layer at timepoint tp (None for 3D data). The last result is cached, so that showing the table again for an unmodified layer does not measure everything again."""
+
+        layer = self.layer_manager.selected_layer
+        stack = layer.data if tp is None else layer.data[tp]
+        key = (id(layer), tp, data_content_key(stack))
+        if key not in self._label_table_cache:
+            if isinstance(stack, da.core.Array):
+                # the chunks of a single timepoint are independent reads, fetch them in parallel
+                stack = stack.compute(
+                    scheduler="threads", num_workers=os.cpu_count()
+                )
+
+            # keep a single entry only, so that tables of old layers or timepoints are not kept alive
+            self._label_table_cache = {
+                key: measure.regionprops_table(
+                    stack, properties=["label", "area", "centroid"]
+                )
+            }
+
+            # painting modifies the data in place, drop the cached table when that happens
+            layer.events.paint.connect(self._clear_label_table_cache)
+            layer.events.data.connect(self._clear_label_table_cache)
+
+        # the table ends up in the layer properties and the plot, return copies so that the cache stays unchanged
+        return {
+            column: values.copy()
+            for column, values in self._label_table_cache[key].items()
+        }
+
+    def _clear_label_table_cache(self, event=None) -> None:
+        """Drop the cached label measurements"""
+
+        self._label_table_cache = {}
 
     def _create_summary_table(self) -> None:
         """Create table displaying the sizes of the different labels in the current stack"""
 
-        if isinstance(self.layer_manager.selected_layer.data, da.core.Array):
-            tp = self.viewer.dims.current_step[0]
-            current_stack = self.layer_manager.selected_layer.data[
-                tp
-            ].compute()  # Compute the current stack
-            self.label_table = measure.regionprops_table(
-                current_stack, properties=["label", "area", "centroid"]
+        layer = self.layer_manager.selected_layer
+        if isinstance(layer.data, da.core.Array) or layer.data.ndim == 4:
+            self.label_table = self._measure_labels(
+                self.viewer.dims.current_step[0]
             )
-            if hasattr(self.layer_manager.selected_layer, "properties"):
-                self.layer_manager.selected_layer.properties = self.label_table
-            if hasattr(self.layer_manager.selected_layer, "features"):
-                self.layer_manager.selected_layer.features = self.label_table
-
+        elif layer.data.ndim == 3:
+            self.label_table = self._measure_labels(None)
         else:
-            if len(self.layer_manager.selected_layer.data.shape) == 4:
-                tp = self.viewer.dims.current_step[0]
-                self.label_table = measure.regionprops_table(
-                    self.layer_manager.selected_layer.data[tp],
-                    properties=["label", "area", "centroid"],
-                )
-                if hasattr(self.layer_manager.selected_layer, "properties"):
-                    self.layer_manager.selected_layer.properties = self.label_table
-                if hasattr(self.layer_manager.selected_layer, "features"):
-                    self.layer_manager.selected_layer.features = self.label_table
-
-            elif len(self.layer_manager.selected_layer.data.shape) == 3:
-                self.label_table = measure.regionprops_table(
-                    self.layer_manager.selected_layer.data, properties=["label", "area", "centroid"]
-                )
-                if hasattr(self.layer_manager.selected_layer, "properties"):
-                    self.layer_manager.selected_layer.properties = self.label_table
-                if hasattr(self.layer_manager.selected_layer, "features"):
-                    self.layer_manager.selected_layer.features = self.label_table
-            else:
-                print("input should be a 3D or 4D array")
-                self.label_table = None
+            print("input should be a 3D or 4D array")
+            self.label_table = None
+
+        if self.label_table is not None:
+            if hasattr(layer, "properties"):
+                layer.properties = self.label_table
+            if hasattr(layer, "features"):
+                layer.features = self.label_table
 
         if self.label_table_widget is not None:
             self.label_table_widget.hide()
 
         if self.viewer is not None:
+            # add the plot widget first, so that every table ends up below it
+            if self.label_plot_widget is None:
+                self.label_plot_widget = PlotWidget(props=pd.DataFrame())
+                self.label_plotting_widgets_layout.addWidget(
+                    self.label_plot_widget
+                )
+
             self.label_table_widget = ColoredTableWidget(
                 self.layer_manager.selected_layer, self.viewer
             )
@@ -209,16 +239,22 @@ class SegmentationWidgets(QWidget):
                 self.label_table
             )
             unique_labels = self.label_plot_widget.props["label"].unique()
-            label_colors = [
-                to_rgb(self.layer_manager.selected_layer.get_color(label)) for label in unique_labels
-            ]
+            try:
+                # map all labels at once, rather than calling get_color per label
+                label_colors = np.asarray(
+                    self.layer_manager.selected_layer.colormap.map(unique_labels)
+                )[:, :3]
+            except (AttributeError, TypeError, ValueError):
+                label_colors = [
+                    to_rgb(self.layer_manager.selected_layer.get_color(label)) for label in unique_labels
+                ]
             self.label_plot_widget.label_colormap = ListedColormap(
                 label_colors
             )
             self.label_plot_widget._update_dropdowns()
 
     def _save_labels(self) -> None:
-        """Save the currently active labels layer. If it consists of multiple timepoints, they are written to multiple 3D stacks."""
+        """Save the currently active labels layer. If it consists of multiple timepoints, they are written to multiple 3D stacks. All stacks are stored with the narrowest dtype that holds the largest label of the layer, or for dask arrays every value of the layer dtype."""
 
         if isinstance(self.layer_manager.selected_layer.data, da.core.Array):
 
@@ -232,31 +268,27 @@ class SegmentationWidgets(QWidget):
                 return False
 
             else:
+                # rechunk once to a single chunk per timepoint, so that each timepoint below is read from disk only once
+                data = self.layer_manager.selected_layer.data.rechunk(
+                    (1,) + self.layer_manager.selected_layer.data.shape[1:]
+                )
+
+                # use the same dtype for all timepoints, so that the saved stacks can be read back as a single array.
+                # Finding the largest label would read all data an extra time, take the range of the layer dtype instead
+                dtype = narrowest_dtype(
+                    1 if data.dtype == bool else np.iinfo(data.dtype).max
+                )
+
                 outputdir = os.path.join(
                     self.outputdir, (self.layer_manager.selected_layer.name + "_finalresult")
                 )
                 if os.path.exists(outputdir):
                     shutil.rmtree(outputdir)
-                os.mkdir(outputdir)
-
-                for i in range(
-                    self.layer_manager.selected_layer.data.shape[0]
-                ):  # Loop over the first dimension
-                    current_stack = self.layer_manager.selected_layer.data[
-                        i
-                    ].compute()  # Compute the current stack
-                    tifffile.imwrite(
-                        os.path.join(
-                            outputdir,
-                            (
-                                self.layer_manager.selected_layer.name
-                                + "_TP"
-                                + str(i).zfill(4)
-                                + ".tif"
-                            ),
-                        ),
-                        np.array(current_stack, dtype="uint16"),
-                    )
+
+                # compute and write all timepoints in parallel
+                write_tiff_stack(
+                    data, outputdir, self.layer_manager.selected_layer.name, dtype
+                )
                 return True
 
         elif len(self.layer_manager.selected_layer.data.shape) == 4:
@@ -265,17 +297,30 @@ class SegmentationWidgets(QWidget):
                 directory="",
                 filter="TIFF files (*.tif *.tiff)",
             )
-            for i in range(self.layer_manager.selected_layer.data.shape[0]):
-                labels_data = self.layer_manager.selected_layer.data[i].astype(np.uint16)
-                tifffile.imwrite(
-                    (
-                        filename.split(".tif")[0]
-                        + "_TP"
-                        + str(i).zfill(4)
-                        + ".tif"
-                    ),
-                    labels_data,
-                )
+
+            if filename:
+                # compress and write the timepoints in parallel, zlib releases the GIL
+                data = self.layer_manager.selected_layer.data
+
+                # use the same dtype for all timepoints, so that the saved stacks can be read back as a single array
+                dtype = narrowest_dtype(data.max() if data.size else 0)
+                with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                    futures = [
+                        executor.submit(
+                            write_tiff,
+                            data[i],
+                            (
+                                filename.split(".tif")[0]
+                                + "_TP"
+                                + str(i).zfill(4)
+                                + ".tif"
+                            ),
+                            dtype,
+                        )
+                        for i in range(data.shape[0])
+                    ]
+                    for future in futures:
+                        future.result()
 
         elif len(self.layer_manager.selected_layer.data.shape) == 3:
             filename, _ = QFileDialog.getSaveFileName(
@@ -285,8 +330,10 @@ class SegmentationWidgets(QWidget):
             )
 
             if filename:
-                labels_data = self.layer_manager.selected_layer.data.astype(np.uint16)
-                tifffile.imwrite(filename, labels_data)
+                data = self.layer_manager.selected_layer.data
+                write_tiff(
+                    data, filename, narrowest_dtype(data.max() if data.size else 0)
+                )
 
         else:
             print("labels should be a 3D or 4D array")
@@ -295,3 +342,4 @@ class SegmentationWidgets(QWidget):
         """Clear all the layers in the viewer"""
 
         self.viewer.layers.clear()
+        self._clear_label_table_cache()
@@ -4,6 +4,7 @@ import napari
 import numpy as np
 import pandas as pd
 import skan
+from napari.qt.threading import thread_worker
 from qtpy.QtWidgets import (
     QComboBox,
     QGroupBox,
@@ -12,12 +13,53 @@ from qtpy.QtWidgets import (
     QVBoxLayout,
     QWidget,
 )
+from scipy import ndimage
 from skimage import morphology
 
-from ..layer_selection.layer_manager import LayerManager
+from ..layer_selection.layer_manager import LayerManager, data_content_key
 from ..plots.plot_widget import PlotWidget
 from ..tables.custom_table_widget import CustomTableWidget
 
+# the colors of the tab20 colormaps, from which the skeleton colormaps are drawn
+COLOR_CYCLE = np.array(
+    [
+        mcolors.to_hex(color)
+        for cmap_name in ("tab20", "tab20b", "tab20c")
+        for color in plt.get_cmap(cmap_name)(np.arange(20))
+    ]
+)
+
+
+def _analyze_skeleton(
+    labels: np.ndarray,
+) -> tuple[np.ndarray, list[np.ndarray], pd.DataFrame]:
+    """Skeletonize the labels and return the degree image, the coordinates of each path and the path summary table"""
+
+    # skeletonize the bounding box of the foreground only, the skeleton outside of it is empty anyway
+    skel = np.zeros(labels.shape, dtype=bool)
+    bbox = ndimage.find_objects((labels != 0).view(np.uint8))
+    if bbox:
+        skel[bbox[0]] = morphology.skeletonize(labels[bbox[0]])
+    degree_image = skan.csr.make_degree_image(skel)
+
+    skeleton = skan.Skeleton(skel)
+    # the rows of the sparse paths matrix hold the pixel indices of each path, split them all at once
+    all_paths = np.split(
+        skeleton.coordinates[skeleton.paths.indices],
+        skeleton.paths.indptr[1:-1],
+    )
+
+    paths_table = skan.summarize(skeleton)
+    paths_table["path-id"] = np.arange(skeleton.n_paths)
+
+    # store the ids in the smallest unsigned integer type that holds them
+    for column in ("skeleton-id", "node-id-src", "node-id-dst", "path-id"):
+        paths_table[column] = pd.to_numeric(
+            paths_table[column], downcast="unsigned"
+        )
+
+    return degree_image, all_paths, paths_table
+
 
 class SkeletonWidget(QScrollArea):
 
@@ -25,6 +67,9 @@ class SkeletonWidget(QScrollArea):
         super().__init__()
         self.viewer = viewer
         self.label_manager = label_manager
+        self._skeleton_cache = {}
+        self._pending_skeleton_key = None
+        self._rng = np.random.default_rng(seed=0xC0FFEE)  # fixed seed for reproducible skeleton colors
 
         ### Skeleton analysis widget
         self.analysis_layout = QVBoxLayout()
@@ -65,35 +110,64 @@ class SkeletonWidget(QScrollArea):
         self.setWidgetResizable(True)
 
     def _skeletonize(self) -> None:
-        """Create skeleton from label image"""
-
-        skel = morphology.skeletonize(self.label_manager.selected_layer.data)
-        degree_image = skan.csr.make_degree_image(skel)
+        """Create skeleton from label image. The skeleton analysis runs in a background thread, so that the viewer stays responsive. The last result is cached, so that creating the skeleton again for an unmodified layer does not skeletonize everything again."""
+
+        layer = self.label_manager.selected_layer
+        key = (id(layer), data_content_key(layer.data))
+        if key in self._skeleton_cache:
+            self._show_cached_skeleton(key)
+            return
+
+        # painting modifies the data in place, drop the cached skeleton when that happens. Connect before
+        # starting, so that painting while the worker runs also keeps its (outdated) result out of the cache
+        layer.events.paint.connect(self._clear_skeleton_cache)
+        layer.events.data.connect(self._clear_skeleton_cache)
+        self._pending_skeleton_key = key
+
+        def _on_returned(result: tuple) -> None:
+            if self._pending_skeleton_key == key:
+                # keep a single entry only, so that the skeletons of old layers are not kept alive
+                self._skeleton_cache = {key: result}
+                self._show_cached_skeleton(key)
+            else:
+                self._show_skeleton(*result)
+
+        self.skeleton_btn.setEnabled(False)
+        worker = thread_worker(_analyze_skeleton)(layer.data)
+        worker.returned.connect(_on_returned)
+        worker.finished.connect(lambda: self.skeleton_btn.setEnabled(True))
+        worker.start()
+
+    def _clear_skeleton_cache(self, event=None) -> None:
+        """Drop the cached skeleton, and the result of a skeleton analysis that is still running"""
+
+        self._skeleton_cache = {}
+        self._pending_skeleton_key = None
+
+    def _show_cached_skeleton(self, key: tuple) -> None:
+        """Show the cached skeleton analysis results. The degree image and table are copied, so that editing the new layer or table does not modify the cache."""
+
+        degree_image, all_paths, paths_table = self._skeleton_cache[key]
+        self._show_skeleton(degree_image.copy(), all_paths, paths_table.copy())
+
+    def _show_skeleton(
+        self,
+        degree_image: np.ndarray,
+        all_paths: list[np.ndarray],
+        paths_table: pd.DataFrame,
+    ) -> None:
+        """Add the skeleton analysis results to the viewer, table and plot"""
+
+        self.paths_table = paths_table
 
         self.viewer.add_labels(degree_image, name="Connectivity")
 
-        skeleton = skan.Skeleton(skel)
-        all_paths = [
-            skeleton.path_coordinates(i) for i in range(skeleton.n_paths)
-        ]
-
-        self.paths_table = skan.summarize(skeleton)
-        self.paths_table["path-id"] = np.arange(skeleton.n_paths)
-
-        # Create a randomized colormap
-        colormaps = ["tab20", "tab20b", "tab20c"]
-        color_cycle = []
-        for cmap_name in colormaps:
-            cmap = plt.get_cmap(cmap_name)
-            colors = [mcolors.to_hex(cmap(i)) for i in range(20)]
-            color_cycle.extend(colors)
-        np.random.shuffle(color_cycle)
-        n_colors = len(np.unique(self.paths_table["path-id"]))
-        repetitions = (n_colors + len(color_cycle) - 1) // len(color_cycle)
-        extended_color_cycle = color_cycle * repetitions
+        # Create a randomized colormap, repeating the shuffled color cycle for all paths
+        color_cycle = self._rng.permutation(COLOR_CYCLE)
         self.random_cmap = mcolors.ListedColormap(
-            extended_color_cycle[:n_colors]
+            np.resize(color_cycle, len(all_paths)).tolist()
         )
+        self._cmap_rgba = mcolors.to_rgba_array(self.random_cmap.colors)
 
         # define shapes layer
         self.skeleton = self.viewer.add_shapes(
@@ -110,8 +184,11 @@ class SkeletonWidget(QScrollArea):
         )
 
         # update table widget
-        self.table_widget.set_content(self.paths_table.to_dict(orient="list"))
-        self.table_widget._recolor(by="skeleton-id", cmap=self.random_cmap)
+        self.table_widget.set_content(
+            self.paths_table.to_dict(orient="list"),
+            color_by="skeleton-id",
+            cmap=self.random_cmap,
+        )
 
         # update plot widget
         self.plot_widget.props = self.paths_table
@@ -124,14 +201,14 @@ class SkeletonWidget(QScrollArea):
 
         if self.skeleton_visualization_dropdown.currentText() == "Path":
 
-            ids = self.skeleton.properties["path-id"]
-            colors = [self.random_cmap.colors[c] for c in ids]
+            ids = np.asarray(self.skeleton.properties["path-id"], dtype=np.intp)
+            colors = self._cmap_rgba[ids]
             self.skeleton.edge_color = colors
             self.skeleton.face_color = colors
             self.table_widget._recolor(by="path-id", cmap=self.random_cmap)
         if self.skeleton_visualization_dropdown.currentText() == "Skeleton":
-            ids = self.skeleton.properties["skeleton-id"]
-            colors = [self.random_cmap.colors[c] for c in ids]
+            ids = np.asarray(self.skeleton.properties["skeleton-id"], dtype=np.intp)
+            colors = self._cmap_rgba[ids]
             self.skeleton.edge_color = colors
             self.skeleton.face_color = colors
             self.table_widget._recolor(by="skeleton-id", cmap=self.random_cmap)
@@ -1,16 +1,21 @@
+import csv
+import os
+
 import napari
+import numpy as np
 import pandas as pd
-from matplotlib.colors import ListedColormap, to_rgb
+from matplotlib.colors import ListedColormap, to_rgb, to_rgba_array
 from napari_skimage_regionprops import TableWidget
 from pandas import DataFrame
-from qtpy.QtGui import QColor
+from qtpy.QtCore import QAbstractTableModel, QModelIndex, Qt
+from qtpy.QtGui import QBrush, QColor
 from qtpy.QtWidgets import (
+    QAbstractItemView,
     QFileDialog,
     QGridLayout,
     QHBoxLayout,
     QPushButton,
-    QTableWidget,
-    QTableWidgetItem,
+    QTableView,
     QWidget,
 )
 
@@ -34,16 +39,34 @@ class ColoredTableWidget(TableWidget):
     def _set_label_colors_to_rows(self) -> None:
         """Apply the colors of the napari label image to the table"""
 
-        for i in range(self._view.rowCount()):
-            label = self._table["label"][i]
-            label_color = to_rgb(self._layer.get_color(label))
-            scaled_color = (
-                int(label_color[0] * 255),
-                int(label_color[1] * 255),
-                int(label_color[2] * 255),
+        n_rows = self._view.rowCount()
+        if n_rows == 0:
+            return
+
+        # look up the color of each distinct label once, instead of once per row
+        unique_labels, inverse = np.unique(
+            np.asarray(self._table["label"][:n_rows]), return_inverse=True
+        )
+        try:
+            label_colors = np.asarray(
+                self._layer.colormap.map(unique_labels)
+            )[:, :3]
+        except (AttributeError, TypeError, ValueError):
+            label_colors = np.array(
+                [to_rgb(self._layer.get_color(label)) for label in unique_labels]
             )
+        # one brush per distinct label, shared by all cells of its rows
+        brushes = [
+            QBrush(QColor(r, g, b))
+            for r, g, b in (label_colors * 255).astype(np.uint8).tolist()
+        ]
+
+        self._view.setUpdatesEnabled(False)
+        for i, label_index in enumerate(inverse.ravel().tolist()):
+            brush = brushes[label_index]
             for j in range(self._view.columnCount()):
-                self._view.item(i, j).setBackground(QColor(*scaled_color))
+                self._view.item(i, j).setData(Qt.BackgroundRole, brush)
+        self._view.setUpdatesEnabled(True)
 
     def _clicked_table(self):
         """Also set show_selected_label to True and jump to the corresponding stack position"""
@@ -63,18 +86,98 @@ class ColoredTableWidget(TableWidget):
         self._viewer.dims.current_step = new_step
 
     def _sort_table(self):
-        """Sorts the table in ascending or descending order"""
+        """Sorts the table in ascending or descending order. The sort is stable, rows with equal values keep their relative order (reversed when descending)."""
 
         selected_column = list(self._table.keys())[self._view.currentColumn()]
-        df = pd.DataFrame(self._table).sort_values(
-            by=selected_column, ascending=self.ascending
+        order = np.argsort(
+            np.asarray(self._table[selected_column]), kind="stable"
         )
+        if not self.ascending:
+            order = order[::-1]
         self.ascending = not self.ascending
 
-        self.set_content(df.to_dict(orient="list"))
+        # permute the columns directly, instead of going through a DataFrame
+        self.set_content(
+            {
+                column: [values[i] for i in order]
+                for column, values in self._table.items()
+            }
+        )
         self._set_label_colors_to_rows()
 
 
+class _TableModel(QAbstractTableModel):
+    """Table model holding the stringified cells and their background brushes. The view only asks for the cells it displays, so no item is created per cell."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.columns = []
+        self.cells = np.empty((0, 0), dtype=str)
+        self.row_colors = None
+        self.cell_colors = {}
+
+    def set_cells(
+        self,
+        columns: list[str],
+        cells: np.ndarray,
+        row_colors: list[QBrush] | None = None,
+    ) -> None:
+        """Replace the content of the model"""
+
+        self.beginResetModel()
+        self.columns = columns
+        self.cells = cells
+        self.row_colors = row_colors
+        self.cell_colors = {}
+        self.endResetModel()
+
+    def set_colors(
+        self,
+        row_colors: list[QBrush] | None,
+        cell_colors: dict[tuple[int, int], QBrush] | None = None,
+    ) -> None:
+        """Replace the background colors of the rows, optionally overriding single (row, column) cells"""
+
+        self.row_colors = row_colors
+        self.cell_colors = {} if cell_colors is None else cell_colors
+        if self.rowCount() > 0 and self.columnCount() > 0:
+            self.dataChanged.emit(
+                self.index(0, 0),
+                self.index(self.rowCount() - 1, self.columnCount() - 1),
+                [Qt.BackgroundRole],
+            )
+
+    def rowCount(self, parent: QModelIndex | None = None) -> int:
+        return (
+            0
+            if parent is not None and parent.isValid()
+            else self.cells.shape[0]
+        )
+
+    def columnCount(self, parent: QModelIndex | None = None) -> int:
+        return (
+            0 if parent is not None and parent.isValid() else len(self.columns)
+        )
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return str(self.cells[index.row(), index.column()])
+        if role == Qt.BackgroundRole:
+            color = self.cell_colors.get((index.row(), index.column()))
+            if color is None and self.row_colors is not None:
+                color = self.row_colors[index.row()]
+            return color
+        return None
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.columns[section]
+        return super().headerData(section, orientation, role)
+
+
 class CustomTableWidget(QWidget):
     """
     Custom table widget based on the napari_skimage_regionprops TableWdiget
@@ -88,9 +191,16 @@ class CustomTableWidget(QWidget):
         self._viewer = viewer
         self.sort_by = None
         self.colormap = None
-
-        self._view = QTableWidget()
-        self._view.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self._color_lut = None
+        self._color_lut_cmap = None
+        self._colored_by = (None, None)  # (column, colormap) of the current row colors
+
+        self._model = _TableModel(self)
+        self._view = QTableView()
+        self._view.setModel(self._model)
+        self._view.setEditTriggers(
+            QAbstractItemView.EditTrigger.NoEditTriggers
+        )
         self.ascending = False
         self._view.horizontalHeader().sectionClicked.connect(self._sort_table)
 
@@ -122,32 +232,50 @@ class CustomTableWidget(QWidget):
             filename, _ = QFileDialog.getSaveFileName(
                 self, "Save as csv...", ".", "*.csv"
             )
-        DataFrame(self._table).to_csv(filename)
+
+        # write the rows straight from the table columns, in the same layout as DataFrame.to_csv (index first)
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f, lineterminator=os.linesep)
+            writer.writerow(["", *self._table.keys()])
+            writer.writerows(
+                [i, *row] for i, row in enumerate(zip(*self._table.values()))
+            )
 
     def _copy_clicked(self):
         DataFrame(self._table).to_clipboard()
 
-    def set_content(self, table: dict):
+    def set_content(
+        self,
+        table: dict,
+        color_by: str | None = None,
+        cmap: ListedColormap | None = None,
+    ):
         """
         Overwrites the content of the table with the content of a given dictionary.
+        If color_by is given, the rows are colored by that column and colormap while the items are created.
         """
         if table is None:
             table = {}
 
         self._table = table
 
-        self._view.clear()
-        try:
-            self._view.setRowCount(len(next(iter(table.values()))))
-            self._view.setColumnCount(len(table))
-        except StopIteration:
-            pass
-
-        for i, column in enumerate(table.keys()):
+        # convert all values to strings in a single pass, kept for reordering the rows when sorting.
+        # Floats are shown with 3 decimals, the table itself keeps the full values for saving and sorting.
+        df = pd.DataFrame(table)
+        for column in df.select_dtypes(include="floating").columns:
+            df[column] = np.char.mod("%.3f", df[column].to_numpy())
+        self._cells = df.astype(str).to_numpy()
+        row_colors = (
+            self._row_colors(color_by, cmap, self._cells.shape[0])
+            if color_by is not None
+            else None
+        )
+        self._model.set_cells(list(table.keys()), self._cells, row_colors)
+        self._colored_by = (color_by, cmap)
 
-            self._view.setHorizontalHeaderItem(i, QTableWidgetItem(column))
-            for j, value in enumerate(table.get(column)):
-                self._view.setItem(j, i, QTableWidgetItem(str(value)))
+        if color_by is not None:
+            self.sort_by = color_by
+            self.colormap = cmap
 
     def get_content(self) -> dict:
         """
@@ -155,38 +283,89 @@ class CustomTableWidget(QWidget):
         """
         return self._table
 
-    def _sort_table(self):
-        """Sorts the table in ascending or descending order"""
+    def _sort_table(self, column: int):
+        """Sorts the table in ascending or descending order by the clicked column. The sort is stable, rows with equal values keep their relative order (reversed when descending)."""
 
-        selected_column = list(self._table.keys())[self._view.currentColumn()]
-        df = pd.DataFrame(self._table).sort_values(
-            by=selected_column, ascending=self.ascending
+        selected_column = list(self._table.keys())[column]
+        order = np.argsort(
+            np.asarray(self._table[selected_column]), kind="stable"
         )
+        if not self.ascending:
+            order = order[::-1]
         self.ascending = not self.ascending
-        self.set_content(df.to_dict(orient="list"))
-        if self.sort_by is not None:
-            self._recolor(self.sort_by, self.colormap)
 
-    def _recolor(self, by: str, cmap: ListedColormap):
-        """Assign colors to the table based on given column and colormap"""
+        # reorder the rows of the model, the view only redraws the visible cells
+        self._table = {
+            column: [values[i] for i in order]
+            for column, values in self._table.items()
+        }
+        self._cells = self._cells[order]
+        row_colors = (
+            self._row_colors(self.sort_by, self.colormap, len(order))
+            if self.sort_by is not None
+            else None
+        )
+        self._model.set_cells(list(self._table.keys()), self._cells, row_colors)
+        self._colored_by = (self.sort_by, self.colormap)
+
+    def _row_colors(
+        self, by: str, cmap: ListedColormap, n_rows: int
+    ) -> list[QBrush]:
+        """Background brushes of the first n_rows rows, looked up from the given column in the colormap"""
+
+        # convert the colormap to packed 0xAARRGGBB values once per colormap
+        if self._color_lut_cmap is not cmap:
+            rgb = (to_rgba_array(cmap.colors)[:, :3] * 255).astype(np.uint32)
+            self._color_lut = (
+                0xFF000000 | (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+            )
+            self._color_lut_cmap = cmap
 
-        default_color = self.palette().color(self.backgroundRole())
-        if by is None:
-            for i in range(self._view.rowCount()):
-                for j in range(self._view.columnCount()):
-                    self._view.item(i, j).setBackground(default_color)
+        # look up the colors of all rows at once, and create each distinct brush only once,
+        # so that Qt does not convert a QColor to a new QBrush for every painted cell
+        labels = np.asarray(self._table[by][:n_rows], dtype=np.intp)
+        unique_colors, inverse = np.unique(
+            self._color_lut[labels], return_inverse=True
+        )
+        pool = [QBrush(QColor.fromRgba(rgba)) for rgba in unique_colors.tolist()]
+        return [pool[i] for i in inverse.ravel().tolist()]
 
-        else:
-            for i in range(self._view.rowCount()):
-                label = self._table[by][i]
-                color = to_rgb(cmap.colors[label])
-                scaled_color = (
-                    int(color[0] * 255),
-                    int(color[1] * 255),
-                    int(color[2] * 255),
-                )
-                for j in range(self._view.columnCount()):
-                    self._view.item(i, j).setBackground(QColor(*scaled_color))
+    def _recolor(self, by: str, cmap: ListedColormap):
+        """Assign colors to the table based on given column and colormap"""
 
         self.sort_by = by
         self.colormap = cmap
+
+        # nothing to do if the rows already have these colors
+        if self._colored_by is not None and (
+            (by is None and self._colored_by[0] is None)
+            or (by == self._colored_by[0] and cmap is self._colored_by[1])
+        ):
+            return
+
+        if by is None:
+            # no color falls back to the default background of the view
+            self._model.set_colors(None)
+        else:
+            self._model.set_colors(
+                self._row_colors(by, cmap, self._model.rowCount())
+            )
+        self._colored_by = (by, cmap)
+
+    def set_cell_colors(
+        self, cell_colors: dict[tuple[int, int], QColor]
+    ) -> None:
+        """Set the background colors of single cells, given as a mapping from (row, column) to color"""
+
+        # one brush per distinct color
+        brushes = {}
+        cell_brushes = {}
+        for cell, color in cell_colors.items():
+            rgba = color.rgba()
+            if rgba not in brushes:
+                brushes[rgba] = QBrush(color)
+            cell_brushes[cell] = brushes[rgba]
+        self._model.set_colors(self._model.row_colors, cell_brushes)
+
+        # the colors no longer follow a single column only
+        self._colored_by = None